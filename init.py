@@ -6,59 +6,251 @@ Make sure to run this with the virtual environment activated:
     python3 init.py
 Or use the venv Python directly:
     venv/bin/python init.py
+
+On Arm CPUs (aarch64/arm64) the oneDNN/OpenMP variables DNNL_DEFAULT_FPMATH_MODE,
+THP_MEM_ALLOC_ENABLE, LRU_CACHE_CAPACITY and OMP_NUM_THREADS get defaults
+before torch is imported; values already set in the environment are kept.
 """
 
+import os
+import platform
+
+# Em CPUs Arm o oneDNN só usa as instruções BF16 de multiplicação de matrizes
+# se isso for configurado antes de o torch ser importado
+if platform.machine() in ("aarch64", "arm64"):
+    os.environ.setdefault("DNNL_DEFAULT_FPMATH_MODE", "BF16")
+    os.environ.setdefault("THP_MEM_ALLOC_ENABLE", "1")
+    os.environ.setdefault("LRU_CACHE_CAPACITY", "1024")
+    os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 1))
+
 import pyaudio
 import wave
 import whisper
-import os
+import torch
+import numpy as np
 import threading
 import time
 from datetime import datetime
+from pathlib import Path
 import sys
 import errno
 
+# faster-whisper (CTranslate2) é opcional: quando instalado, substitui o
+# backend PyTorch de referência com pesos quantizados em int8
+try:
+    from faster_whisper import WhisperModel
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:  # versões anteriores à 1.1
+        BatchedInferencePipeline = None
+except ImportError:
+    WhisperModel = None
+    BatchedInferencePipeline = None
+
+# A partir desta duração o faster-whisper decodifica as janelas de 30 s em lote
+LONG_AUDIO_SECONDS = 60
+
+# Detecção de fala por energia, usada para cortar silêncios no backend
+# openai-whisper (o faster-whisper usa o próprio VAD Silero)
+VAD_FRAME_MS = 30
+# O limiar é relativo à gravação: o ruído de fundo é estimado por um percentil
+# baixo da energia dos quadros e fala é o que fica acima dele com folga. Um
+# limiar absoluto descartaria a voz baixa do outro lado da chamada
+VAD_NOISE_PERCENTILE = 10
+VAD_NOISE_MARGIN = 2.0  # ~ +6 dB acima do ruído de fundo
+VAD_MIN_RMS = 1e-4  # ~ -80 dBFS, para gravações com silêncio digital
+# Teto absoluto do limiar: em chamadas com poucas pausas (menos de ~10% de
+# silêncio) o percentil cai sobre a voz do participante mais baixo, e sem o
+# teto a fala dele seria cortada. Quadros acima deste nível nunca são removidos
+VAD_MAX_RMS = 0.003  # ~ -50 dBFS
+VAD_PAD_FRAMES = 10  # margem de 300 ms mantida em volta de cada trecho de fala
+VAD_MIN_SILENCE_MS = 500
+
+# Modelos já carregados, compartilhados entre instâncias e reaproveitados
+# ao trocar de tamanho no menu: (modelo, dispositivo, compute_type) -> (model, backend)
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def _audio_duration(audio):
+    """Duração em segundos de um array de 16 kHz ou de um arquivo WAV (None se desconhecida)"""
+    if isinstance(audio, np.ndarray):
+        return len(audio) / whisper.audio.SAMPLE_RATE
+    try:
+        with wave.open(audio, 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _strip_silence(audio):
+    """
+    Remove os trechos de silêncio de um áudio float32 de 16 kHz
+
+    Quadros de VAD_FRAME_MS com energia (RMS) próxima do ruído de fundo da
+    própria gravação, e abaixo de VAD_MAX_RMS, contam como silêncio. Só
+    trechos de silêncio com pelo menos VAD_MIN_SILENCE_MS (além da margem em
+    volta da fala) são removidos; pausas curtas e fala baixa são mantidas. Se nenhum quadro tiver fala, o
+    áudio é devolvido inteiro.
+    """
+    frame_len = whisper.audio.SAMPLE_RATE * VAD_FRAME_MS // 1000
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return audio
+
+    frames = audio[:n_frames * frame_len].reshape(n_frames, frame_len)
+    # einsum soma os quadrados de cada quadro sem materializar o array frames * frames
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame_len)
+    noise_floor = np.percentile(rms, VAD_NOISE_PERCENTILE)
+    threshold = min(max(noise_floor * VAD_NOISE_MARGIN, VAD_MIN_RMS), VAD_MAX_RMS)
+    voiced = rms > threshold
+    if not voiced.any():
+        return audio
+
+    # Estender cada quadro com fala pela margem antes e depois dele
+    window = np.ones(2 * VAD_PAD_FRAMES + 1)
+    voiced = np.convolve(voiced, window)[VAD_PAD_FRAMES:VAD_PAD_FRAMES + n_frames] > 0
+    if voiced.all():
+        return audio
+
+    # Manter os trechos de silêncio mais curtos que VAD_MIN_SILENCE_MS
+    min_silence_frames = VAD_MIN_SILENCE_MS // VAD_FRAME_MS
+    edges = np.diff(np.concatenate(([1], voiced.astype(np.int8), [1])))
+    for start, end in zip(np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)):
+        if end - start < min_silence_frames:
+            voiced[start:end] = True
+    if voiced.all():
+        return audio
+
+    return frames[voiced].reshape(-1)
+
+
 class AudioRecorderTranscriber:
-    def __init__(self, model_size="base"):
+    # Partes fixas da linha do cronômetro, montadas uma única vez
+    _TIMER_PREFIX = "\r🔴 Gravando... "
+    _TIMER_SUFFIX = " | Pressione ENTER para parar"
+    _CLEAR_LINE = "\r" + " " * 70 + "\r"
+
+    def __init__(self, model_size="base", device=None, compute_type=None):
         """
         Inicializa o gravador e transcritor de áudio.
 
         Args:
             model_size: Tamanho padrão do modelo Whisper (tiny, base, small, medium, large)
+            device: Dispositivo de inferência (cuda, cpu). Padrão: cuda quando disponível
+            compute_type: Tipo dos pesos no faster-whisper (int8, int8_float16, float16...).
+                Padrão: int8 na CPU e int8_float16 na GPU
         """
         self.chunk = 1024
         self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
         self.recording = False
-        self.frames = []
+        self.frames = bytearray()
+        self.frames_len = 0
         self.start_time = None
+        self.timer_thread = None
+        self._stop_event = threading.Event()
         self.model_size = model_size
         self.model = None
         self.loaded_model_name = None
+        self.backend = None
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.compute_type = compute_type or ("int8_float16" if self.device == "cuda" else "int8")
 
         self.audio = pyaudio.PyAudio()
 
-    def _load_model(self, model_size=None):
-        """Carrega o modelo Whisper apenas quando necessário"""
-        requested_model = model_size or self.model_size
+    def _load_model(self, model_size=None, verbose=True):
+        """
+        Carrega o modelo Whisper apenas quando necessário
 
-        if self.model and self.loaded_model_name == requested_model:
-            return self.model
+        Args:
+            model_size: Tamanho do modelo; usa o padrão da instância se omitido
+            verbose: Exibe as mensagens de progresso (erros são sempre exibidos)
+        """
+        requested_model = model_size or self.model_size
+        self.model_size = requested_model
+        key = (requested_model, self.device, self.compute_type)
 
-        print(f"Carregando modelo Whisper '{requested_model}'...")
-        try:
-            self.model_size = requested_model
-            self.model = whisper.load_model(requested_model)
-            self.loaded_model_name = requested_model
-            print("Modelo carregado com sucesso!")
-        except Exception as e:
-            print(f"❌ Não foi possível carregar o modelo '{requested_model}': {e}")
-            self.model = None
-            self.loaded_model_name = None
+        with _MODEL_CACHE_LOCK:
+            cached = _MODEL_CACHE.get(key)
+            if cached is None:
+                if verbose:
+                    print(f"Carregando modelo Whisper '{requested_model}'...")
+                try:
+                    if WhisperModel is not None:
+                        model = WhisperModel(
+                            requested_model,
+                            device=self.device,
+                            compute_type=self.compute_type
+                        )
+                        cached = (model, "faster-whisper")
+                    elif requested_model.startswith("distil-"):
+                        raise ValueError("modelos distil-whisper exigem o pacote faster-whisper")
+                    else:
+                        model = whisper.load_model(requested_model, device=self.device)
+                        if self.device == "cuda":
+                            # O mel de entrada do encoder tem forma fixa (80x3000), então o
+                            # autotune do cuDNN escolhe o melhor algoritmo de convolução uma vez
+                            torch.backends.cudnn.benchmark = True
+                            # Matmuls que permanecem em FP32 usam TF32 nas GPUs que suportam
+                            torch.backends.cuda.matmul.allow_tf32 = True
+                        cached = (model, "whisper")
+                    _MODEL_CACHE[key] = cached
+                    if verbose:
+                        print("Modelo carregado com sucesso!")
+                except Exception as e:
+                    print(f"❌ Não foi possível carregar o modelo '{requested_model}': {e}")
+                    self.model = None
+                    self.loaded_model_name = None
+                    self.backend = None
+                    return None
 
+        self.model, self.backend = cached
+        self.loaded_model_name = requested_model
         return self.model
 
+    def _run_transcription(self, model, audio, language):
+        """Executa a transcrição com o backend carregado e retorna o texto"""
+        if self.backend == "faster-whisper":
+            duration = _audio_duration(audio)
+            if BatchedInferencePipeline is not None and (duration is None or duration > LONG_AUDIO_SECONDS):
+                # Áudio longo: os trechos de fala são agrupados e decodificados em lote
+                pipeline = BatchedInferencePipeline(model=model)
+                segments, _ = pipeline.transcribe(
+                    audio,
+                    language=language,
+                    beam_size=1,
+                    batch_size=16 if self.device == "cuda" else 4,
+                    vad_filter=True,
+                    vad_parameters={"min_silence_duration_ms": VAD_MIN_SILENCE_MS}
+                )
+            else:
+                segments, _ = model.transcribe(
+                    audio,
+                    language=language,
+                    beam_size=1,
+                    vad_filter=True,
+                    vad_parameters={"min_silence_duration_ms": VAD_MIN_SILENCE_MS}
+                )
+            return "".join(segment.text for segment in segments)
+
+        # O openai-whisper não tem VAD: os silêncios são cortados antes, para que
+        # o modelo não gaste janelas de 30 s decodificando trechos sem fala
+        if not isinstance(audio, np.ndarray):
+            audio = whisper.load_audio(audio)
+        audio = _strip_silence(audio)
+
+        # inference_mode dispensa o rastreamento de autograd durante a decodificação
+        with torch.inference_mode():
+            result = model.transcribe(
+                audio,
+                language=language,
+                fp16=self.device == "cuda",
+                verbose=False
+            )
+        return result["text"]
+
     def _format_time(self, seconds):
         """Formata o tempo em MM:SS ou HH:MM:SS"""
         hours = int(seconds // 3600)
@@ -72,53 +264,86 @@ class AudioRecorderTranscriber:
     
     def _update_timer(self):
         """Atualiza o cronômetro na tela"""
+        write = sys.stdout.write
+        flush = sys.stdout.flush
+        last_sec = None
+
         while self.recording:
             if self.start_time:
-                elapsed = time.time() - self.start_time
-                time_str = self._format_time(elapsed)
-                print(f"\r🔴 Gravando... {time_str} | Pressione ENTER para parar", end="", flush=True)
-            time.sleep(0.1)  # Atualiza a cada 0.1 segundos para suavidade
+                sec = int(time.monotonic() - self.start_time)
+                # O texto só muda quando vira o segundo; evita reescrever a mesma linha
+                if sec != last_sec:
+                    last_sec = sec
+                    # A linha inteira é redesenhada a partir do \r: se outra saída
+                    # (ex.: download do modelo) escrever no terminal durante a
+                    # gravação, o cronômetro se realinha no segundo seguinte
+                    write(self._TIMER_PREFIX + self._format_time(sec) + self._TIMER_SUFFIX)
+                    flush()
+            # Verifica 4 vezes por segundo, mas sai imediatamente quando a gravação para
+            if self._stop_event.wait(0.25):
+                break
     
-    def start_recording(self):
-        """Inicia a gravação de áudio"""
+    def _audio_callback(self, in_data, frame_count, time_info, status):
+        """Recebe cada bloco de áudio diretamente da thread do PortAudio"""
+        end = self.frames_len + len(in_data)
+        if end > len(self.frames):
+            # Dobra a capacidade: poucas realocações mesmo em gravações longas
+            self.frames.extend(bytes(max(len(self.frames), len(in_data))))
+        self.frames[self.frames_len:end] = in_data
+        self.frames_len = end
+        return (None, pyaudio.paContinue)
+
+    def start_recording(self, expected_duration_s=300):
+        """
+        Inicia a gravação de áudio (não bloqueia; os blocos chegam via callback)
+
+        Args:
+            expected_duration_s: Duração esperada, usada para pré-alocar o buffer;
+                gravações mais longas dobram a capacidade quando ela acaba
+        """
         self.recording = True
-        self.frames = []
-        self.start_time = time.time()
+        self._stop_event.clear()
+        bytes_per_second = self.rate * self.channels * self.audio.get_sample_size(self.format)
+        self.frames = bytearray(bytes_per_second * expected_duration_s)
+        self.frames_len = 0
+        self.start_time = time.monotonic()
         
+        # Em modo callback o PortAudio entrega os blocos em sua própria thread,
+        # sem um laço de leitura em Python disputando o GIL
         self.stream = self.audio.open(
             format=self.format,
             channels=self.channels,
             rate=self.rate,
             input=True,
-            frames_per_buffer=self.chunk
+            frames_per_buffer=self.chunk,
+            stream_callback=self._audio_callback
         )
         
-        # Iniciar thread do cronômetro
-        timer_thread = threading.Thread(target=self._update_timer, daemon=True)
-        timer_thread.start()
-        
-        print("\n🔴 Gravando... 00:00 | Pressione ENTER para parar")
-        
-        while self.recording:
-            try:
-                data = self.stream.read(self.chunk, exception_on_overflow=False)
-                self.frames.append(data)
-            except Exception as e:
-                print(f"\nErro na gravação: {e}")
-                break
-        
+        # Iniciar thread do cronômetro apenas em terminal interativo; com a saída
+        # redirecionada o redesenho com \r só acordaria a thread à toa.
+        # No terminal a linha é desenhada só pela thread, para que nenhum print
+        # concorrente se misture ao primeiro desenho
+        if sys.stdout.isatty():
+            print(flush=True)
+            self.timer_thread = threading.Thread(target=self._update_timer, daemon=True)
+            self.timer_thread.start()
+        else:
+            print("\n🔴 Gravando... 00:00 | Pressione ENTER para parar")
     
     def stop_recording(self):
         """Para a gravação de áudio"""
         if self.recording:
             self.recording = False
-            # Pequeno delay para garantir que o cronômetro pare antes de limpar
-            time.sleep(0.15)
+            self._stop_event.set()
+            # Garantir que o cronômetro pare antes de limpar a linha
+            if self.timer_thread:
+                self.timer_thread.join()
+                self.timer_thread = None
             # Limpar linha do cronômetro
-            print("\r" + " " * 70 + "\r", end="", flush=True)
+            print(self._CLEAR_LINE, end="", flush=True)
             
             if self.start_time:
-                elapsed = time.time() - self.start_time
+                elapsed = time.monotonic() - self.start_time
                 time_str = self._format_time(elapsed)
                 self.stream.stop_stream()
                 self.stream.close()
@@ -131,7 +356,7 @@ class AudioRecorderTranscriber:
     
     def save_audio(self, filename=None):
         """Salva o áudio gravado em arquivo WAV"""
-        if not self.frames:
+        if not self.frames_len:
             print("Nenhum áudio para salvar")
             return None
         
@@ -142,6 +367,9 @@ class AudioRecorderTranscriber:
         # Criar pasta de gravações se não existir
         os.makedirs("gravacoes", exist_ok=True)
         filepath = os.path.join("gravacoes", filename)
+        # Grava em um arquivo temporário e renomeia no final: o WAV em gravacoes/
+        # nunca fica pela metade se a escrita falhar
+        tmp_path = filepath + ".part"
         
         # Tentar salvar o áudio, com tratamento especial para erro de espaço em disco
         max_retries = 10
@@ -149,17 +377,27 @@ class AudioRecorderTranscriber:
         
         while retry_count < max_retries:
             try:
-                wf = wave.open(filepath, 'wb')
-                wf.setnchannels(self.channels)
-                wf.setsampwidth(self.audio.get_sample_size(self.format))
-                wf.setframerate(self.rate)
-                wf.writeframes(b''.join(self.frames))
-                wf.close()
+                # Arquivo com buffer grande: cabeçalho e ajustes de tamanho feitos
+                # pelo wave no fechamento não viram várias escritas pequenas
+                with open(tmp_path, 'wb', buffering=4 * 1024 * 1024) as fp:
+                    sample_width = self.audio.get_sample_size(self.format)
+                    # O escritor wave é fechado antes do arquivo, mesmo se a escrita
+                    # falhar; senão o __del__ dele tentaria escrever no arquivo fechado
+                    with wave.open(fp, 'wb') as wf:
+                        wf.setnchannels(self.channels)
+                        wf.setsampwidth(sample_width)
+                        wf.setframerate(self.rate)
+                        # Com o total de quadros conhecido o cabeçalho já sai correto e o
+                        # wave não precisa voltar ao início do arquivo para corrigi-lo
+                        wf.setnframes(self.frames_len // (self.channels * sample_width))
+                        wf.writeframes(memoryview(self.frames)[:self.frames_len])
+                os.replace(tmp_path, filepath)
                 
                 print(f"✅ Áudio salvo: {filepath}")
                 return filepath
                 
             except OSError as e:
+                self._remove_partial(tmp_path)
                 if e.errno == errno.ENOSPC:  # No space left on device
                     print(f"\n❌ Erro: [Errno {e.errno}] No space left on device: '{filepath}'")
                     print("\n⚠️  ATENÇÃO: O áudio gravado foi preservado na memória.")
@@ -180,6 +418,7 @@ class AudioRecorderTranscriber:
                     print(f"❌ Erro ao salvar áudio: {e}")
                     return None
             except Exception as e:
+                self._remove_partial(tmp_path)
                 print(f"❌ Erro ao salvar áudio: {e}")
                 return None
         
@@ -187,13 +426,31 @@ class AudioRecorderTranscriber:
         print("⚠️  O áudio ainda está na memória. Tente novamente mais tarde.")
         return None
     
-    def transcribe_audio(self, audio_file, language="pt", model_size=None):
+    def _remove_partial(self, path):
+        """Remove um arquivo incompleto deixado por uma escrita que falhou"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _recorded_audio(self):
+        """Converte o áudio gravado para o formato de entrada do Whisper (float32, 16 kHz)"""
+        if self.channels != 1 or self.rate != whisper.audio.SAMPLE_RATE:
+            return None
+        # Uma única cópia (int16 -> float32); a escala é aplicada no mesmo buffer
+        samples = np.frombuffer(self.frames, dtype=np.int16, count=self.frames_len // 2).astype(np.float32)
+        samples *= 1.0 / 32768.0
+        return samples
+
+    def transcribe_audio(self, audio_file, language="pt", model_size=None, audio=None):
         """
         Transcreve um arquivo de áudio usando Whisper
         
         Args:
             audio_file: Caminho do arquivo de áudio
             language: Idioma do áudio (pt, en, es, etc.)
+            audio: Amostras já em memória (float32, 16 kHz). Quando informado,
+                evita que o Whisper releia e decodifique o arquivo com ffmpeg
         """
         print(f"\n🎯 Transcrevendo áudio: {audio_file}")
 
@@ -203,17 +460,11 @@ class AudioRecorderTranscriber:
             return None
         
         try:
-            result = model.transcribe(
-                audio_file,
-                language=language,
-                fp16=False,
-                verbose=False
-            )
-            
-            transcription = result["text"]
+            source = audio if audio is not None else audio_file
+            transcription = self._run_transcription(model, source, language)
             
             # Salvar transcrição em arquivo txt
-            txt_file = audio_file.replace(".wav", ".txt")
+            txt_file = Path(audio_file).with_suffix(".txt")
             with open(txt_file, "w", encoding="utf-8") as f:
                 f.write(transcription)
             
@@ -228,9 +479,8 @@ class AudioRecorderTranscriber:
     
     def record_only(self):
         """Grava áudio apenas, sem transcrever"""
-        # Iniciar gravação em thread separada
-        record_thread = threading.Thread(target=self.start_recording, daemon=True)
-        record_thread.start()
+        # Iniciar gravação
+        self.start_recording()
         
         # Aguardar pressionar ENTER para parar
         try:
@@ -240,7 +490,6 @@ class AudioRecorderTranscriber:
         
         # Parar gravação
         self.stop_recording()
-        record_thread.join(timeout=1.0)
         
         # Salvar áudio
         audio_file = self.save_audio()
@@ -248,9 +497,18 @@ class AudioRecorderTranscriber:
     
     def record_and_transcribe(self, language="pt", model_size=None):
         """Grava áudio e transcreve automaticamente"""
-        # Iniciar gravação em thread separada
-        record_thread = threading.Thread(target=self.start_recording, daemon=True)
-        record_thread.start()
+        # Carregar o modelo em segundo plano durante a gravação, sem mensagens
+        # para não atrapalhar o cronômetro; transcribe_audio aguarda no lock
+        # do cache caso o carregamento ainda não tenha terminado
+        threading.Thread(
+            target=self._load_model,
+            args=(model_size,),
+            kwargs={"verbose": False},
+            daemon=True
+        ).start()
+        
+        # Iniciar gravação
+        self.start_recording()
         
         # Aguardar pressionar ENTER para parar
         try:
@@ -260,14 +518,18 @@ class AudioRecorderTranscriber:
         
         # Parar gravação
         self.stop_recording()
-        record_thread.join(timeout=1.0)
         
         # Salvar áudio
         audio_file = self.save_audio()
         
         if audio_file:
-            # Transcrever
-            self.transcribe_audio(audio_file, language=language, model_size=model_size)
+            # Transcrever a partir do áudio que já está em memória
+            self.transcribe_audio(
+                audio_file,
+                language=language,
+                model_size=model_size,
+                audio=self._recorded_audio()
+            )
     
     def transcribe_existing_file(self, filepath, language="pt", model_size=None):
         """Transcreve um arquivo de áudio existente"""
@@ -290,9 +552,19 @@ def escolher_modelo():
     print("3. small  - Mais preciso, mais lento")
     print("4. medium - Muito preciso, lento")
     print("5. large  - Máxima precisão, muito lento")
+    print("6. turbo  - large-v3-turbo: quase a precisão do large, bem mais rápido")
+    print("7. distil - distil-large-v3: ainda mais rápido, só inglês (requer faster-whisper)")
 
-    escolha = input("\nEscolha o modelo (1-5) [2]: ").strip() or "2"
-    modelos = {"1": "tiny", "2": "base", "3": "small", "4": "medium", "5": "large"}
+    escolha = input("\nEscolha o modelo (1-7) [2]: ").strip() or "2"
+    modelos = {
+        "1": "tiny",
+        "2": "base",
+        "3": "small",
+        "4": "medium",
+        "5": "large",
+        "6": "large-v3-turbo",
+        "7": "distil-large-v3",
+    }
     return modelos.get(escolha, "base")
 
 
@@ -2,31 +2,143 @@
 """
 Audio Transcription Script using OpenAI Whisper
 Transcribes audio files to text with support for multiple languages and models.
+
+On Arm CPUs (aarch64/arm64) the oneDNN/OpenMP variables DNNL_DEFAULT_FPMATH_MODE,
+THP_MEM_ALLOC_ENABLE, LRU_CACHE_CAPACITY and OMP_NUM_THREADS get defaults
+before torch is imported; values already set in the environment are kept.
 """
 
 import os
+import platform
+
+# On Arm CPUs oneDNN only dispatches matmuls to the BF16 matrix-multiply
+# instructions if this is configured before torch is imported
+if platform.machine() in ("aarch64", "arm64"):
+    os.environ.setdefault("DNNL_DEFAULT_FPMATH_MODE", "BF16")
+    os.environ.setdefault("THP_MEM_ALLOC_ENABLE", "1")
+    os.environ.setdefault("LRU_CACHE_CAPACITY", "1024")
+    os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 1))
+
 import sys
 import argparse
+import wave
 import whisper
+import torch
 from pathlib import Path
 
+# faster-whisper (CTranslate2) is optional: when installed it replaces the
+# reference PyTorch backend with int8-quantized weights
+try:
+    from faster_whisper import WhisperModel
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:  # releases before 1.1
+        BatchedInferencePipeline = None
+except ImportError:
+    WhisperModel = None
+    BatchedInferencePipeline = None
+
+# Above this duration faster-whisper decodes the 30s windows in batches
+LONG_AUDIO_SECONDS = 60
+
+# Loaded models, reused by repeated transcribe_audio calls in the same process
+_MODEL_CACHE = {}
+
+
+def _resolve_device(device):
+    """
+    Resolve the requested device to a concrete one.
+    
+    'auto' (or None) picks CUDA when available and falls back to CPU.
+    MPS is not offered: openai-whisper's sparse alignment_heads buffer
+    cannot be moved to MPS and CTranslate2 has no MPS support.
+    """
+    if device in (None, "auto"):
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def _load_model(model_size, device, compute_type, cache_dir=None):
+    """
+    Load a Whisper model, reusing it if it was already loaded.
+    
+    Args:
+        model_size: Whisper model size
+        device: Device to run on ('cuda' or 'cpu')
+        compute_type: faster-whisper weight type (ignored by openai-whisper)
+        cache_dir: Directory where model files are downloaded and reused.
+            If None, each backend uses its default cache location
+    
+    Returns:
+        The loaded model
+    """
+    key = (model_size, device, compute_type)
+    model = _MODEL_CACHE.get(key)
+    if model is not None:
+        return model
+    
+    print(f"📥 Loading Whisper model '{model_size}'...")
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+    
+    if WhisperModel is not None:
+        model = WhisperModel(
+            model_size,
+            device=device,
+            compute_type=compute_type,
+            download_root=cache_dir
+        )
+    elif model_size.startswith("distil-"):
+        raise ValueError("distil-whisper models require the faster-whisper package")
+    else:
+        model = whisper.load_model(model_size, device=device, download_root=cache_dir)
+    print("✅ Model loaded successfully!")
+    
+    _MODEL_CACHE[key] = model
+    return model
+
+
+def _audio_duration(audio_file):
+    """
+    Get the duration of a WAV file without decoding it.
+    
+    Returns:
+        float: Duration in seconds, or None if the file is not a readable WAV
+    """
+    try:
+        with wave.open(str(audio_file), 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
 
 def transcribe_audio(
     audio_file,
     model_size="base",
     language=None,
     output_file=None,
-    verbose=False
+    verbose=False,
+    device=None,
+    compute_type=None,
+    cache_dir=None
 ):
     """
     Transcribe an audio file using Whisper.
     
     Args:
         audio_file: Path to the audio file to transcribe
-        model_size: Whisper model size (tiny, base, small, medium, large, turbo)
+        model_size: Whisper model size (tiny, base, small, medium, large, turbo,
+            large-v3-turbo, distil-large-v3)
         language: Language code (e.g., 'pt', 'en', 'es'). If None, auto-detect
         output_file: Path to save transcription. If None, saves next to audio file
         verbose: Print detailed progress information
+        device: Device to run on ('auto', 'cuda' or 'cpu'). If None or
+            'auto', uses CUDA when available
+        compute_type: Weight/compute type ('float32', 'float16', 'int8',
+            'int8_float16'). If None, picks int8 on CPU and int8_float16 on CUDA.
+            openai-whisper only distinguishes float32 from half precision
+        cache_dir: Directory to download and reuse model files from. If None,
+            uses the backend's default cache
     
     Returns:
         str: The transcribed text
@@ -36,11 +148,13 @@ def transcribe_audio(
         print(f"❌ Error: File not found: {audio_file}")
         sys.exit(1)
     
+    device = _resolve_device(device)
+    if compute_type is None:
+        compute_type = "int8_float16" if device == "cuda" else "int8"
+    
     # Load Whisper model
-    print(f"📥 Loading Whisper model '{model_size}'...")
     try:
-        model = whisper.load_model(model_size)
-        print("✅ Model loaded successfully!")
+        model = _load_model(model_size, device, compute_type, cache_dir)
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         sys.exit(1)
@@ -50,23 +164,52 @@ def transcribe_audio(
     print("⏳ This may take a while depending on audio length and model size...")
     
     try:
-        transcribe_options = {
-            "fp16": False,
-            "verbose": verbose
-        }
-        
         if language:
-            transcribe_options["language"] = language
             print(f"🌐 Language: {language}")
         else:
             print("🌐 Language: Auto-detecting...")
         
-        result = model.transcribe(audio_file, **transcribe_options)
-        
-        transcription = result["text"].strip()
+        if WhisperModel is not None and isinstance(model, WhisperModel):
+            duration = _audio_duration(audio_file)
+            if BatchedInferencePipeline is not None and (duration is None or duration > LONG_AUDIO_SECONDS):
+                # Long audio: speech chunks are grouped and decoded in batches
+                pipeline = BatchedInferencePipeline(model=model)
+                segments, info = pipeline.transcribe(
+                    audio_file,
+                    language=language,
+                    beam_size=1,
+                    batch_size=16 if device == "cuda" else 4
+                )
+            else:
+                segments, info = model.transcribe(
+                    audio_file,
+                    language=language,
+                    beam_size=1,
+                    vad_filter=True
+                )
+            # segments is a generator: decoding happens while iterating it
+            collected = []
+            for segment in segments:
+                if verbose:
+                    print(f"[{segment.start:.2f}s -> {segment.end:.2f}s] {segment.text.strip()}")
+                collected.append(segment)
+            segments = collected
+            transcription = "".join(segment.text for segment in segments).strip()
+            detected_language = info.language
+        else:
+            transcribe_options = {
+                "fp16": device == "cuda" and compute_type != "float32",
+                "verbose": verbose
+            }
+            if language:
+                transcribe_options["language"] = language
+            
+            result = model.transcribe(audio_file, **transcribe_options)
+            transcription = result["text"].strip()
+            detected_language = result.get("language", "unknown")
+            segments = result.get("segments", [])
         
         # Detect language if not specified
-        detected_language = result.get("language", "unknown")
         if not language:
             print(f"🌐 Detected language: {detected_language}")
         
@@ -90,8 +233,8 @@ def transcribe_audio(
         print(f"\n✅ Transcription saved to: {output_file}")
         
         # Print segments if verbose
-        if verbose and "segments" in result:
-            print(f"\n📊 Segments: {len(result['segments'])}")
+        if verbose:
+            print(f"\n📊 Segments: {len(segments)}")
         
         return transcription
         
@@ -121,6 +264,9 @@ Examples:
   
   # Verbose output
   python transcribe.py audio.wav --verbose
+  
+  # Force CPU with int8 weights
+  python transcribe.py audio.wav --device cpu --compute-type int8
         """
     )
     
@@ -132,9 +278,12 @@ Examples:
     parser.add_argument(
         "--model", "-m",
         default="base",
-        choices=["tiny", "base", "small", "medium", "large", "turbo"],
+        choices=["tiny", "base", "small", "medium", "large", "turbo",
+                 "large-v3-turbo", "distil-large-v3"],
         help="Whisper model size (default: base). "
-             "Larger models are more accurate but slower."
+             "Larger models are more accurate but slower. "
+             "'large-v3-turbo' is close to 'large' with a 4-layer decoder; "
+             "'distil-large-v3' is faster still, English-only, and requires faster-whisper."
     )
     
     parser.add_argument(
@@ -157,6 +306,29 @@ Examples:
         help="Print detailed progress information"
     )
     
+    parser.add_argument(
+        "--device",
+        default="auto",
+        choices=["auto", "cuda", "cpu"],
+        help="Device to run the model on (default: auto = CUDA if available, else CPU)."
+    )
+    
+    parser.add_argument(
+        "--compute-type",
+        default=None,
+        choices=["float32", "float16", "int8", "int8_float16"],
+        help="Weight/compute precision (default: int8 on CPU, int8_float16 on CUDA). "
+             "Full choice applies to faster-whisper; openai-whisper uses float32 "
+             "or half precision."
+    )
+    
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory where model files are downloaded and reused across runs "
+             "(default: the backend's own cache, e.g. ~/.cache/whisper)."
+    )
+    
     args = parser.parse_args()
     
     # Run transcription
@@ -165,7 +337,10 @@ Examples:
         model_size=args.model,
         language=args.language,
         output_file=args.output,
-        verbose=args.verbose
+        verbose=args.verbose,
+        device=args.device,
+        compute_type=args.compute_type,
+        cache_dir=args.cache_dir
     )
 
 